@@ -1,11 +1,18 @@
-import json
-
-import requests
+import aiohttp
+import argparse
+import asyncio
+import collections
 import csv
-import time
+import itertools
+import orjson
 import os
-import urllib.parse
-from typing import List, Dict, Any
+import psutil
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional
 
 from dotenv import load_dotenv
 
@@ -14,70 +21,155 @@ ANYMAILFINDER_API_ENDPOINT = "https://api.anymailfinder.com/v5.0/search/decision
 DECISION_MAKER_CATEGORY = "hr"  # Category for Human Resources
 INPUT_DOMAINS_FILE = "domains.txt"  # File containing domains, one per line
 OUTPUT_CSV_FILE = "hr_emails_results_bulk.csv"  # Output CSV file
+OUTPUT_PARQUET_FILE = "hr_emails_results_bulk.parquet"  # Output file for --format parquet
 API_TIMEOUT_SECONDS = 180 # Recommended timeout
-REQUEST_DELAY_SECONDS = 0.1 # Small delay between requests (API says no rate limits, but a small delay can be gentle)
+MAX_PENDING_ROWS = 10_000 # Upper bound on finished rows held in memory (queue) before searches block
+ESTIMATED_ROW_BYTES = 2048 # Rough in-memory size of one result row, used to size buffers to free RAM
+FLUSH_INTERVAL_SECONDS = 5.0 # Longest a finished row waits in memory before it is written out
+OUTPUT_BUFFER_BYTES = 1 << 20 # 1 MiB file buffer (default is 8 KiB) to cut write() syscalls
+MAX_CONCURRENT_REQUESTS = 64 # Upper bound on API calls in flight at once
+MIN_CONCURRENT_REQUESTS = 1 # Lower bound the concurrency backs off to under pressure
+INITIAL_CONCURRENT_REQUESTS = 16 # Starting concurrency, grown/shrunk adaptively (AIMD)
+MAX_PENDING_SEARCHES = 2 * MAX_CONCURRENT_REQUESTS # Searches scheduled ahead of free slots (caps memory)
+LATENCY_WINDOW = 32 # Number of recent response latencies used for the rolling mean
+LATENCY_SLOWDOWN_FACTOR = 2.0 # Latency above this multiple of the rolling mean counts as "slow"
+KEEPALIVE_SECONDS = 60 # How long idle connections to the API stay in the pool for reuse
+DNS_CACHE_SECONDS = 300 # How long the API host's DNS lookup is cached
+MAX_ATTEMPTS = 5 # Tries per domain for timeouts, connection errors and retryable HTTP statuses
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Statuses that say nothing about the domain itself (overload, bad API key, out of
+# credits): stored as RETRY_LATER_ERROR_TYPE so a resumed run searches the domain again
+RETRY_LATER_STATUS_CODES = RETRYABLE_STATUS_CODES | {401, 402}
+RETRY_LATER_ERROR_TYPE = "retry_later"
+RETRY_BASE_DELAY_SECONDS = 1.0 # First retry waits about this long, doubling each time
+RETRY_JITTER_SECONDS = 1.0 # Random extra wait so retries don't arrive in lockstep
+RETRY_MAX_DELAY_SECONDS = 30.0 # Cap on a single back-off wait
+RATE_LIMIT_REQUESTS_PER_MINUTE = 3000 # Client-side ceiling (API documents no hard limit)
+RATE_LIMIT_LOW_REMAINING = 2 # Pause when the API reports this many requests (or fewer) left
+RATE_LIMIT_DEFAULT_PAUSE_SECONDS = 1.0 # Pause used when capacity is low but no retry-after/reset is given
+RATE_LIMIT_MAX_PAUSE_SECONDS = 60.0 # Cap on any pause requested by rate-limit headers
+EPOCH_THRESHOLD_SECONDS = 365 * 24 * 3600 # Reset values above this are Unix timestamps, not durations
+
+# --- Output layout ---
+CSV_HEADER = [
+    "Domain Searched",
+    "Category Searched",
+    "Found Name",
+    "Found Email",
+    "Email Verified",
+    "Job Title",
+    "LinkedIn URL",
+    "Search Success",
+    "API Error Type",
+    "API Error Explanation"
+]
+# Defaults for every column after domain/category, overwritten per result:
+# name, email, email verified, job title, LinkedIn URL, success, error type, error explanation
+DEFAULT_ROW = ("N/A",) * 5 + ("False", "N/A", "N/A")
+# Columns stored as booleans (null for "N/A") in Parquet output
+BOOLEAN_COLUMNS = {"Email Verified", "Search Success"}
+# "API Error Type" values for failures that may succeed on a later run (network
+# problems, RETRY_LATER_STATUS_CODES, non-JSON error bodies). Resuming drops these
+# rows and searches their domains again; every other row counts as processed.
+TRANSIENT_ERROR_TYPES = {
+    "timeout", "connection_error", "request_exception", "unexpected_error", "api_error",
+    RETRY_LATER_ERROR_TYPE
+}
+ERROR_TYPE_COLUMN = CSV_HEADER.index("API Error Type")
+
+# The host: everything up to the first path/query/fragment (scheme and 'www.' already stripped)
+_HOST_RE = re.compile(r'[^/?#\s]+')
 
 load_dotenv()
 
 # --- Script ---
 
-def get_api_key() -> str:
-    """Gets the API key from user input or environment variable."""
-    # Prioritize environment variable for security
-    api_key = os.environ.get("ANYMAILFINDER_API_KEY")
-    if api_key:
-        print("Using API key from environment variable ANYMAILFINDER_API_KEY")
-        return api_key
-    else:
-        # If not in environment, prompt the user
-        api_key = input("Please enter your Anymailfinder API Key: ")
-        if not api_key:
-            print("API Key is required.")
-            exit(1)
-        return api_key
+def parse_args() -> argparse.Namespace:
+    """Parses command line options."""
+    parser = argparse.ArgumentParser(description="Bulk HR decision-maker email lookup via the Anymailfinder API.")
+    parser.add_argument(
+        "--api-key",
+        # Prefer the environment variable (or .env) so the key stays out of shell history
+        default=os.environ.get("ANYMAILFINDER_API_KEY"),
+        help="Anymailfinder API key (default: ANYMAILFINDER_API_KEY environment variable)"
+    )
+    parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=None,
+        help="Rows written to the output file per batch (default: sized from available memory)"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Overwrite existing output instead of resuming (skipping domains already in it)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help=f"Output format: csv ({OUTPUT_CSV_FILE}) or parquet ({OUTPUT_PARQUET_FILE}, needs pyarrow)"
+    )
+    args = parser.parse_args()
+    # Never prompt: the script must run unattended
+    if not args.api_key:
+        parser.error("API key required via --api-key or ANYMAILFINDER_API_KEY")
+    if args.batch_rows is not None and args.batch_rows < 1:
+        parser.error("--batch-rows must be at least 1")
+    return args
+
+def memory_budgeted_batch_rows() -> int:
+    """
+    Picks the write batch size from currently available memory, so the
+    result queue (4 batches) plus the batch being built cannot exhaust RAM.
+    """
+    max_pending = min(MAX_PENDING_ROWS, psutil.virtual_memory().available // ESTIMATED_ROW_BYTES)
+    return max(1, max_pending // 4)
 
 def clean_domain(domain_input: str) -> str:
     """
     Cleans a domain string by removing URL prefixes (http/https),
-    'www.', and trailing slashes.
+    'www.', and any path, query or trailing slash.
     """
-    if not domain_input:
+    domain = domain_input.strip().lower()
+    if not domain:
         return ""
 
-    # Add a dummy scheme if none exists, to help urlparse
-    if not domain_input.startswith('http://') and not domain_input.startswith('https://'):
-        domain_input = 'http://' + domain_input # Use http as a placeholder
-
-    parsed_url = urllib.parse.urlparse(domain_input)
-    cleaned_domain = parsed_url.netloc
-
-    # Remove 'www.' if present
-    if cleaned_domain.startswith('www.'):
-        cleaned_domain = cleaned_domain[4:]
-
-    # Ensure no trailing slash remains (though netloc shouldn't have one)
-    if cleaned_domain.endswith('/'):
-        cleaned_domain = cleaned_domain[:-1]
-
-    return cleaned_domain
-
-def read_domains_from_file(filename: str) -> List[str]:
+    # Fast path: most inputs are already bare domains (e.g. 'example.com')
+    if (
+        '/' not in domain and ':' not in domain and '?' not in domain and '#' not in domain
+        and ' ' not in domain and '\t' not in domain and not domain.startswith('www.')
+    ):
+        return domain
+
+    # Prefixes are sliced off rather than made optional in the regex, which
+    # would backtrack and capture e.g. 'http:' from a bare 'http://'
+    if domain.startswith('https://'):
+        domain = domain[8:]
+    elif domain.startswith('http://'):
+        domain = domain[7:]
+    if domain.startswith('www.'):
+        domain = domain[4:]
+
+    match = _HOST_RE.match(domain)
+    return match.group(0) if match else ""
+
+def iter_domains(filename: str) -> Iterator[str]:
     """
-    Reads domains from a text file, one domain per line,
-    cleans them, and returns a list of unique, valid domains.
+    Lazily reads domains from a text file, one domain per line,
+    and yields each unique, valid cleaned domain as soon as it is read.
     """
-    domains = set() # Use a set to automatically handle duplicates
+    seen = set() # Only used to skip duplicates
     try:
         with open(filename, 'r', encoding='utf-8') as f:
             for line in f:
                 raw_domain = line.strip()
                 cleaned = clean_domain(raw_domain)
-                if cleaned: # Only add if cleaning resulted in a non-empty string
-                    domains.add(cleaned)
+                if cleaned and cleaned not in seen: # Skip empty results and duplicates
+                    seen.add(cleaned)
+                    yield cleaned
 
-        domain_list = list(domains) # Convert back to list
-        print(f"Read and cleaned {len(domain_list)} unique domains from {filename}")
-        return domain_list
+        print(f"Read and cleaned {len(seen)} unique domains from {filename}")
     except FileNotFoundError:
         print(f"Error: Input file '{filename}' not found.")
         exit(1)
@@ -85,146 +177,571 @@ def read_domains_from_file(filename: str) -> List[str]:
         print(f"Error reading domains file: {e}")
         exit(1)
 
-def search_decision_maker(api_key: str, domain: str, category: str) -> Dict[str, Any]:
+class RateLimiter:
+    """
+    Sliding-window requests-per-minute limiter that also reacts to the
+    API's rate-limit headers, so requests are only delayed when needed.
+    """
+
+    def __init__(self, requests_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self._timestamps = collections.deque() # Send times within the last 60s
+        self._paused_until = 0.0 # Loop time before which no request may be sent
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a request may be sent and records it in the window."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                # Drop timestamps that fell out of the 60s window
+                while self._timestamps and now - self._timestamps[0] >= 60:
+                    self._timestamps.popleft()
+
+                if len(self._timestamps) < self.requests_per_minute:
+                    self._timestamps.append(now)
+                    return
+                await asyncio.sleep(60 - (now - self._timestamps[0]))
+
+    def update_from_headers(self, headers) -> None:
+        """Pauses all future requests if the response says capacity is (nearly) exhausted."""
+        retry_after = _parse_seconds(headers.get("retry-after"))
+        remaining = _parse_seconds(
+            headers.get("x-ratelimit-remaining-requests", headers.get("x-ratelimit-remaining"))
+        )
+
+        if retry_after is not None:
+            delay = retry_after
+        elif remaining is not None and remaining <= RATE_LIMIT_LOW_REMAINING:
+            reset = _parse_seconds(
+                headers.get("x-ratelimit-reset-requests", headers.get("x-ratelimit-reset"))
+            )
+            if reset is None:
+                delay = RATE_LIMIT_DEFAULT_PAUSE_SECONDS
+            elif reset > EPOCH_THRESHOLD_SECONDS:
+                # Many APIs send the reset as a Unix timestamp rather than a duration
+                delay = max(0.0, reset - time.time())
+            else:
+                delay = reset
+        else:
+            return
+
+        # Never trust a header enough to stall the run indefinitely
+        delay = min(delay, RATE_LIMIT_MAX_PAUSE_SECONDS)
+        now = asyncio.get_running_loop().time()
+        if now >= self._paused_until: # Log once per pause, not per response
+            print(f"  Rate limit reached, pausing requests for {delay:.1f}s")
+        self._paused_until = max(self._paused_until, now + delay)
+
+class ConcurrencyController:
+    """
+    AIMD (additive increase, multiplicative decrease) limit on in-flight
+    requests: grows by 0.5 per fast success and halves on 429/5xx/timeouts,
+    at most once per congestion event.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, window: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self._in_flight = 0
+        self._latencies = collections.deque(maxlen=window)
+        self._last_decrease = float("-inf") # Loop time of the most recent halving
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Waits for a free slot under the current (possibly resized) limit."""
+        async with self._condition:
+            while self._in_flight >= int(self.limit):
+                await self._condition.wait()
+            self._in_flight += 1
+
+    async def release(self):
+        """Frees a slot and wakes waiters so they re-check the limit."""
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        """Additive increase, unless this response was much slower than recent ones."""
+        slow = (
+            len(self._latencies) == self._latencies.maxlen
+            and latency > LATENCY_SLOWDOWN_FACTOR * (sum(self._latencies) / len(self._latencies))
+        )
+        self._latencies.append(latency)
+        if not slow:
+            self.limit = min(self.maximum, self.limit + 0.5)
+
+    def on_overload(self, started: float) -> None:
+        """
+        Multiplicative decrease after a 429, 5xx or timeout. Requests sent
+        before the previous decrease saw the same congestion, so their
+        failures are ignored instead of halving the limit again.
+        """
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * 0.5)
+        self._last_decrease = asyncio.get_running_loop().time()
+
+def _parse_seconds(value: Optional[str]) -> Optional[float]:
+    """Parses a numeric header value, returning None if missing or not a number."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+async def search_decision_maker(session: aiohttp.ClientSession, rate_limiter: RateLimiter, controller: ConcurrencyController, domain: str, category: str) -> Dict[str, Any]:
     """Searches for a decision maker using the Anymailfinder API."""
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
+    # Encoded once per domain and reused by every retry
+    payload = orjson.dumps({
         "domain": domain, # Use the cleaned domain here
         "decision_maker_category": category
-    }
+    })
 
     print(f"Searching for {category} at {domain}...")
 
-    try:
-        response = requests.post(
-            ANYMAILFINDER_API_ENDPOINT,
-            headers=headers,
-            json=data,
-            timeout=API_TIMEOUT_SECONDS
-        )
-
-        # Check for HTTP errors (4xx or 5xx)
-        response.raise_for_status()
-
-        # Parse the JSON response
-        return response.json()
-
-    except requests.exceptions.Timeout:
-        print(f"  Request timed out for {domain}.")
-        return {"success": False, "error": "timeout", "error_explained": "Request timed out."}
-    except requests.exceptions.ConnectionError:
-         print(f"  Connection error for {domain}. Check your internet connection.")
-         return {"success": False, "error": "connection_error", "error_explained": "Connection error."}
-    except requests.exceptions.RequestException as e:
-        print(f"  API Request failed for {domain}: {e}")
-        status_code = 'N/A'
-        response_text = 'N/A'
+    loop = asyncio.get_running_loop()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if attempt > 1:
+            delay = retry_delay(attempt - 1)
+            print(f"  Retrying {domain} in {delay:.1f}s (attempt {attempt}/{MAX_ATTEMPTS})...")
+            await asyncio.sleep(delay)
+        final_attempt = attempt == MAX_ATTEMPTS
+
+        # Hold a concurrency slot only while the request is in flight, not during back-off
+        await controller.acquire()
+        started = loop.time()
         try:
-            if e.response is not None:
-                 status_code = e.response.status_code
-                 response_text = e.response.text # Get raw text in case JSON parsing fails
-                 error_details = e.response.json() # Attempt to get JSON error details
-                 return {"success": False, "error": error_details.get('error', 'request_exception'), "error_explained": error_details.get('error_explained', str(e))}
-            else:
-                 return {"success": False, "error": "request_exception", "error_explained": str(e)}
-        except json.JSONDecodeError:
-             # If response body is not JSON
-             return {"success": False, "error": "api_error", "error_explained": f"API returned status {status_code} with non-JSON body: {response_text[:100]}..."} # Limit body print
-        except Exception as parse_error:
-            return {"success": False, "error": "api_error", "error_explained": f"API returned status {status_code} and parsing error: {parse_error}"}
-    except Exception as e:
-        print(f"  An unexpected error occurred for {domain}: {e}")
-        return {"success": False, "error": "unexpected_error", "error_explained": str(e)}
+            await rate_limiter.acquire()
+            started = loop.time()
+            async with session.post(
+                ANYMAILFINDER_API_ENDPOINT,
+                data=payload,
+                timeout=aiohttp.ClientTimeout(total=API_TIMEOUT_SECONDS)
+            ) as response:
+                rate_limiter.update_from_headers(response.headers)
+                if response.status == 429 or response.status >= 500:
+                    controller.on_overload(started)
+                else:
+                    controller.on_success(loop.time() - started)
+
+                # Check for HTTP errors (4xx or 5xx)
+                if response.status >= 400:
+                    print(f"  API Request failed for {domain}: HTTP {response.status} {response.reason}")
+                    status_code = response.status
+                    response_body = await response.read() # Keep raw bytes in case JSON parsing fails
+                    if status_code in RETRYABLE_STATUS_CODES and not final_attempt:
+                        continue
+                    try:
+                        error_details = orjson.loads(response_body) # Attempt to get JSON error details
+                        api_error = error_details.get('error', 'request_exception')
+                        api_error_explained = error_details.get('error_explained', f"HTTP {status_code}")
+                    except orjson.JSONDecodeError:
+                        # If response body is not JSON
+                        response_text = response_body[:100].decode('utf-8', errors='replace') # Limit body print
+                        api_error = "api_error"
+                        api_error_explained = f"API returned status {status_code} with non-JSON body: {response_text}..."
+                    except Exception as parse_error:
+                        api_error = "api_error"
+                        api_error_explained = f"API returned status {status_code} and parsing error: {parse_error}"
+
+                    if status_code in RETRY_LATER_STATUS_CODES:
+                        # Not an answer about this domain, whatever the body says
+                        return {"success": False, "error": RETRY_LATER_ERROR_TYPE, "error_explained": f"HTTP {status_code} ({api_error}): {api_error_explained}"}
+                    return {"success": False, "error": api_error, "error_explained": api_error_explained}
+
+                # Parse the JSON response
+                return orjson.loads(await response.read())
+
+        except asyncio.TimeoutError:
+            controller.on_overload(started)
+            print(f"  Request timed out for {domain}.")
+            if not final_attempt:
+                continue
+            return {"success": False, "error": "timeout", "error_explained": "Request timed out."}
+        except aiohttp.ClientConnectionError:
+             controller.on_overload(started)
+             print(f"  Connection error for {domain}. Check your internet connection.")
+             if not final_attempt:
+                 continue
+             return {"success": False, "error": "connection_error", "error_explained": "Connection error."}
+        except aiohttp.ClientError as e:
+            print(f"  API Request failed for {domain}: {e}")
+            return {"success": False, "error": "request_exception", "error_explained": str(e)}
+        except Exception as e:
+            print(f"  An unexpected error occurred for {domain}: {e}")
+            return {"success": False, "error": "unexpected_error", "error_explained": str(e)}
+        finally:
+            await controller.release()
+
+def retry_delay(retry_number: int) -> float:
+    """Exponential back-off with jitter for the given retry (1 = first retry)."""
+    backoff = RETRY_BASE_DELAY_SECONDS * 2 ** (retry_number - 1)
+    return min(backoff + random.uniform(0, RETRY_JITTER_SECONDS), RETRY_MAX_DELAY_SECONDS)
+
+async def search_and_enqueue(queue: asyncio.Queue, session: aiohttp.ClientSession, rate_limiter: RateLimiter, controller: ConcurrencyController, domain: str, category: str) -> None:
+    """Producer: runs a single search and hands the finished row to the writer."""
+    result = await search_decision_maker(session, rate_limiter, controller, domain, category)
+    await queue.put(build_result_row(domain, category, result))
+
+async def write_results(queue: asyncio.Queue, result_writer: "ResultWriter", batch_rows: int) -> None:
+    """
+    Consumer: the only task that touches the output file. Drains rows
+    from the queue and writes them in batches until it gets None. A
+    batch is also written once its oldest row has waited
+    FLUSH_INTERVAL_SECONDS, so a killed run loses at most that much
+    work. Batches are written on a single worker thread, so disk writes
+    (and Parquet encoding) run in order without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    pending_rows = []
+    flush_deadline = None
+    next_row = None
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-writer") as executor:
+        try:
+            while True:
+                if next_row is None:
+                    next_row = asyncio.ensure_future(queue.get())
+                # Waiting on the same get() task across timeouts never drops a row
+                timeout = None if flush_deadline is None else max(0.0, flush_deadline - loop.time())
+                done, _ = await asyncio.wait({next_row}, timeout=timeout)
+
+                if done:
+                    row = next_row.result()
+                    next_row = None
+                    if row is None:
+                        break
+                    if not pending_rows:
+                        flush_deadline = loop.time() + FLUSH_INTERVAL_SECONDS
+                    pending_rows.append(row)
+
+                if len(pending_rows) >= batch_rows or (pending_rows and loop.time() >= flush_deadline):
+                    batch, pending_rows, flush_deadline = pending_rows, [], None
+                    await loop.run_in_executor(executor, result_writer.write_rows, batch)
+        finally:
+            if next_row is not None:
+                next_row.cancel()
+            # Whatever is pending is flushed on exit
+            await loop.run_in_executor(executor, result_writer.write_rows, pending_rows)
+
+async def wait_for_progress(pending_searches: set, writer_task: asyncio.Task) -> None:
+    """
+    Waits until at least one search finishes and removes it from
+    pending_searches. Also watches the writer: if it dies (e.g. disk
+    full) the run fails here instead of searches blocking forever on
+    a full queue.
+    """
+    done, _ = await asyncio.wait(pending_searches | {writer_task}, return_when=asyncio.FIRST_COMPLETED)
+    if writer_task in done:
+        writer_task.result() # Re-raises the writer's error
+        raise RuntimeError("Result writer stopped before all searches finished")
+    pending_searches.difference_update(done)
+    for task in done:
+        task.result() # Surface unexpected errors
+
+def build_result_row(domain: str, category: str, result: Dict[str, Any]) -> List[Any]:
+    """Turns an API response (or caught error) into a CSV row (see CSV_HEADER)."""
+    row = [domain, category, *DEFAULT_ROW]
+    result_get = result.get
+
+    if result_get("success") is True and result_get("result") is not None:
+        # Successful find
+        person_get = result["result"].get
+        row[2] = name = person_get("personFullName", "N/A")
+        row[3] = email = person_get("email", "N/A")
+        row[4] = person_get("emailVerified", False) # Get boolean, will write as True/False
+        row[5] = person_get("personJobTitle", "N/A")
+        row[6] = person_get("personLinkedinUrl", "N/A")
+        row[7] = "True"
+        print(f"  Success ({domain}): Found {name} ({email})")
+
+    elif result_get("success") is False:
+         # API returned a specific error (e.g., bad_request, not_found, payment_needed) or our script caught an exception
+         row[8] = api_error_type = result_get("error", "Unknown")
+         row[9] = api_error_explained = result_get("error_explained", "No explanation provided.")
+         print(f"  Failed ({domain}): {api_error_type} - {api_error_explained}")
 
+    else:
+        # Handles cases with success=True but result=None, or unexpected API response structure
+        row[8] = "no_result_found"
+        row[9] = "API call successful but no result found or unexpected response structure."
+        print(f"  Failed ({domain}): No result found or unexpected response.")
 
-def main():
-    api_key = get_api_key()
-    domains = read_domains_from_file(INPUT_DOMAINS_FILE)
+    return row
 
-    if not domains:
-        print("No valid domains found in the input file after cleaning. Exiting.")
-        return
 
-    with open(OUTPUT_CSV_FILE, 'w', newline='', encoding='utf-8') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        # Write header row based on expected output
-        csv_writer.writerow([
-            "Domain Searched",
-            "Category Searched",
-            "Found Name",
-            "Found Email",
-            "Email Verified",
-            "Job Title",
-            "LinkedIn URL",
-            "Search Success",
-            "API Error Type",
-            "API Error Explanation"
-        ])
+class ResultWriter(ABC):
+    """
+    Base class for output writers; usable as a context manager.
+    processed_domains holds the domains already present in the output
+    when an earlier run is being resumed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.processed_domains = set()
+
+    @abstractmethod
+    def write_rows(self, rows: List[List[Any]]) -> None:
+        """Appends rows (in CSV_HEADER order) to the output."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Flushes anything buffered and closes the output file."""
 
-        for domain in domains:
-            if not domain:
-                continue # Should not happen with cleaned domains
-
-            result = search_decision_maker(api_key, domain, DECISION_MAKER_CATEGORY)
-
-            # --- Process the API response and write to CSV ---
-            name = "N/A"
-            email = "N/A"
-            email_verified = "N/A"
-            job_title = "N/A"
-            linkedin_url = "N/A"
-            search_success = "False" # Default to false, update if successful
-            api_error_type = "N/A"
-            api_error_explained = "N/A"
-
-
-            if result.get("success") is True and result.get("result") is not None:
-                # Successful find
-                found_person = result["result"]
-                name = found_person.get("personFullName", "N/A")
-                email = found_person.get("email", "N/A")
-                email_verified = found_person.get("emailVerified", False) # Get boolean, will write as True/False
-                job_title = found_person.get("personJobTitle", "N/A")
-                linkedin_url = found_person.get("personLinkedinUrl", "N/A")
-                search_success = "True"
-                print(f"  Success: Found {name} ({email})")
-
-            elif result.get("success") is False:
-                 # API returned a specific error (e.g., bad_request, not_found, payment_needed) or our script caught an exception
-                 api_error_type = result.get("error", "Unknown")
-                 api_error_explained = result.get("error_explained", "No explanation provided.")
-                 print(f"  Failed: {api_error_type} - {api_error_explained}")
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CsvResultWriter(ResultWriter):
+    """
+    Writes result rows to a CSV file with a header row. When resuming,
+    appends to an existing file instead of truncating it.
+    """
 
+    def __init__(self, path: str, resume: bool):
+        super().__init__(path)
+        resuming = resume and os.path.exists(path) and self._rewrite_complete_records()
+
+        self._file = open(path, 'a' if resuming else 'w', newline='', encoding='utf-8', buffering=OUTPUT_BUFFER_BYTES)
+        self._writer = csv.writer(self._file)
+        if not resuming:
+            # Write header row based on expected output
+            self._writer.writerow(CSV_HEADER)
+            self._file.flush()
+
+    def _rewrite_complete_records(self) -> bool:
+        """
+        Copies the existing file's complete records to a temporary file,
+        recording their domains, and swaps it in with os.replace. This
+        drops a trailing record cut off by an interrupted run (even one
+        ending inside a quoted field) and rows for transient failures,
+        which are searched again. Returns False if no header survived.
+        """
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', newline='', encoding='utf-8', buffering=OUTPUT_BUFFER_BYTES) as temp:
+            writer = csv.writer(temp)
+            records = _read_complete_csv_records(self.path)
+            if next(records, None) is None: # Header row
+                resuming = False
             else:
-                # Handles cases with success=True but result=None, or unexpected API response structure
-                search_success = "False"
-                api_error_type = "no_result_found"
-                api_error_explained = "API call successful but no result found or unexpected response structure."
-                print(f"  Failed: No result found or unexpected response.")
+                resuming = True
+                writer.writerow(CSV_HEADER)
+                for row in records:
+                    if len(row) > ERROR_TYPE_COLUMN and row[ERROR_TYPE_COLUMN] in TRANSIENT_ERROR_TYPES:
+                        continue
+                    self.processed_domains.add(row[0])
+                    writer.writerow(row)
+
+        if resuming:
+            os.replace(temp_path, self.path)
+        else:
+            os.remove(temp_path)
+        return resuming
+
+    def write_rows(self, rows: List[List[Any]]) -> None:
+        self._writer.writerows(rows)
+        # The large buffer still batches syscalls within a write; flushing here
+        # gets each batch to disk so a killed run can resume from it
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class ParquetResultWriter(ResultWriter):
+    """
+    Writes result rows to a zstd-compressed Parquet file. Rows are
+    buffered as columns and written one row group at a time. Parquet
+    files cannot be appended to, so resuming loads the existing table
+    (minus rows for transient failures) and writes it back first.
+    Everything goes to a temporary file that only replaces the original
+    on close, so an interrupted run never destroys results from earlier
+    runs. The flip side: a hard-killed run loses all of its own rows,
+    since the temporary file has no footer until close.
+    """
 
+    def __init__(self, path: str, resume: bool, row_group_rows: int):
+        super().__init__(path)
+        self._row_group_rows = row_group_rows # Same as the write batch, so it stays in the memory budget
+        try:
+            import pyarrow as pa
+            import pyarrow.compute as pc
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("Error: --format parquet requires pyarrow (pip install pyarrow).")
+            exit(1)
 
-            # Write the row to the CSV
-            csv_writer.writerow([
-                domain,
-                DECISION_MAKER_CATEGORY,
-                name,
-                email,
-                email_verified,
-                job_title,
-                linkedin_url,
-                search_success,
-                api_error_type,
-                api_error_explained
-            ])
+        self._pa = pa
+        self._schema = pa.schema([
+            (name, pa.bool_() if name in BOOLEAN_COLUMNS else pa.string())
+            for name in CSV_HEADER
+        ])
 
-            # Add a small delay between requests to be courteous
-            time.sleep(REQUEST_DELAY_SECONDS)
+        existing = None
+        if resume and os.path.exists(path):
+            try:
+                existing = pq.read_table(path).cast(self._schema)
+            except Exception as e:
+                print(f"Error: cannot resume from '{path}' ({e}). Use --fresh to start over.")
+                exit(1)
+            transient = pc.is_in(existing.column(ERROR_TYPE_COLUMN), value_set=pa.array(sorted(TRANSIENT_ERROR_TYPES)))
+            existing = existing.filter(pc.invert(transient))
+            self.processed_domains = set(existing.column(CSV_HEADER[0]).to_pylist())
+
+        self._temp_path = path + ".tmp"
+        self._writer = pq.ParquetWriter(self._temp_path, self._schema, compression='zstd')
+        if existing is not None:
+            self._writer.write_table(existing)
+        self._columns = [[] for _ in CSV_HEADER]
+
+    def write_rows(self, rows: List[List[Any]]) -> None:
+        for row in rows:
+            for column, value in zip(self._columns, row):
+                column.append(value)
+        if len(self._columns[0]) >= self._row_group_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._columns[0]:
+            return
+        arrays = [
+            self._pa.array(_to_parquet_values(column, field.type == self._pa.bool_()), type=field.type)
+            for column, field in zip(self._columns, self._schema)
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        for column in self._columns:
+            column.clear()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+        os.replace(self._temp_path, self.path) # Atomic: the original stays readable until now
+
+def _to_parquet_values(values: List[Any], boolean: bool) -> List[Any]:
+    """Normalizes CSV-style cell values ("True"/"N/A"/mixed types) for a typed Parquet column."""
+    if boolean:
+        return [value if isinstance(value, bool) else {"True": True, "False": False}.get(value) for value in values]
+    return [value if value is None or isinstance(value, str) else str(value) for value in values]
+
+def _read_complete_csv_records(path: str) -> Iterator[List[str]]:
+    """
+    Yields the records of a CSV file, stopping before a trailing record
+    left incomplete by an interrupted run: one whose last line has no
+    newline, or whose quoted field was never closed.
+    """
+    last_line_complete = True
 
+    def lines() -> Iterator[str]:
+        nonlocal last_line_complete
+        with open(path, 'rb') as f:
+            for raw_line in f:
+                last_line_complete = raw_line.endswith(b'\n')
+                yield raw_line.decode('utf-8', errors='replace')
 
-    print(f"\nScript finished. Results saved to {OUTPUT_CSV_FILE}")
+    try:
+        # csv.reader pulls lines only up to the end of each record, so
+        # last_line_complete always refers to the record just parsed
+        for row in csv.reader(lines(), strict=True):
+            if not last_line_complete:
+                return
+            if row:
+                yield row
+    except csv.Error:
+        return # Unterminated quoted field at end of file
+
+def open_result_writer(output_format: str, resume: bool, batch_rows: int) -> ResultWriter:
+    """Opens the output writer for the chosen --format."""
+    if output_format == "parquet":
+        return ParquetResultWriter(OUTPUT_PARQUET_FILE, resume, batch_rows)
+    return CsvResultWriter(OUTPUT_CSV_FILE, resume)
+
+
+async def main():
+    args = parse_args()
+    api_key = args.api_key
+    # Same for every request of the run, so attached once as session defaults below
+    # (per-request headers would be re-converted and merged by aiohttp on every call)
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    domains = iter_domains(INPUT_DOMAINS_FILE)
+
+    first_domain = next(domains, None)
+    if first_domain is None:
+        print("No valid domains found in the input file after cleaning. Exiting.")
+        return
+    domains = itertools.chain([first_domain], domains)
+
+    batch_rows = args.batch_rows or memory_budgeted_batch_rows()
+    print(f"Writing results in batches of {batch_rows} rows")
+
+    with open_result_writer(args.format, resume=not args.fresh, batch_rows=batch_rows) as result_writer:
+        processed_domains = result_writer.processed_domains
+        if processed_domains:
+            print(f"Resuming: skipping {len(processed_domains)} domains already in {result_writer.path}")
+            domains = (domain for domain in domains if domain not in processed_domains)
+            first_domain = next(domains, None)
+            if first_domain is None:
+                print("All domains have already been processed. Exiting.")
+                return
+            domains = itertools.chain([first_domain], domains)
+
+        controller = ConcurrencyController(
+            INITIAL_CONCURRENT_REQUESTS,
+            MIN_CONCURRENT_REQUESTS,
+            MAX_CONCURRENT_REQUESTS,
+            LATENCY_WINDOW
+        )
+        rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS_PER_MINUTE)
+
+        # One session (and connection pool) for the whole run, so TCP+TLS
+        # handshakes are paid once per pooled connection instead of per domain
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONCURRENT_REQUESTS,
+            limit_per_host=MAX_CONCURRENT_REQUESTS,
+            keepalive_timeout=KEEPALIVE_SECONDS,
+            ttl_dns_cache=DNS_CACHE_SECONDS
+        )
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+            # Searches produce rows into a bounded queue and a single writer task consumes
+            # them, so a search only waits on the writer when the queue is full
+            queue = asyncio.Queue(maxsize=4 * batch_rows)
+            writer_task = asyncio.ensure_future(write_results(queue, result_writer, batch_rows))
+
+            # Domains are pulled from the file only as search slots free up, so the
+            # first request goes out before the whole input has been read
+            pending_searches = set()
+            try:
+                for domain in domains:
+                    if len(pending_searches) >= MAX_PENDING_SEARCHES:
+                        await wait_for_progress(pending_searches, writer_task)
+                    pending_searches.add(asyncio.ensure_future(
+                        search_and_enqueue(queue, session, rate_limiter, controller, domain, DECISION_MAKER_CATEGORY)
+                    ))
+
+                while pending_searches:
+                    await wait_for_progress(pending_searches, writer_task)
+            finally:
+                # Only non-empty if the run is failing: stop the remaining searches
+                for task in pending_searches:
+                    task.cancel()
+                await asyncio.gather(*pending_searches, return_exceptions=True)
+
+                if not writer_task.done():
+                    await queue.put(None) # Sentinel: no more rows
+                await writer_task # Re-raises a writer error
+
+    print(f"\nScript finished. Results saved to {result_writer.path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())